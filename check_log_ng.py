@@ -28,6 +28,8 @@ from __future__ import unicode_literals
 import sys
 import os
 import io
+import errno
+import stat
 import glob
 import time
 import re
@@ -75,6 +77,7 @@ class LogChecker(object):
     _SUFFIX_CACHE = ".cache"
     _SUFFIX_LOCK = ".lock"
     _RETRY_PERIOD = 0.5
+    _RE_INLINE_FLAGS = re.compile(r'\(\?[aiLmsux-]')
     _LOGFORMAT_EXPANSION_LIST = [
         {'%%': '_PERCENT_'},
         {'%F': '%Y-%m-%d'},
@@ -167,10 +170,20 @@ class LogChecker(object):
         if self.config['case_insensitive']:
             self.pattern_flags = re.IGNORECASE
 
+        # compile the patterns once, not on every line.
+        self.pattern_matchers = {}
+        for pattern_type in ['pattern', 'critical_pattern',
+                             'negpattern', 'critical_negpattern']:
+            self.pattern_matchers[pattern_type] = LogChecker._compile_pattern_list(
+                self.config[pattern_type + '_list'], self.pattern_flags)
+
         self.re_logformat = re.compile(LogChecker._expand_logformat_by_strftime(
             self.config['logformat']))
         _debug("logformat='{0}'".format(self.re_logformat.pattern))
 
+        # cache of the file names of seek files
+        self._seekfile_cache = {}
+
         # status variables
         self.state = None
         self.message = None
@@ -180,12 +193,12 @@ class LogChecker(object):
         self.critical_found = []
         self.critical_found_messages = []
 
-    def _check_updated(self, logfile, offset, filesize):
+    def _check_updated(self, mtime, offset, filesize):
         """Check whether the log file is updated.
 
         If updated, return True.
         """
-        if os.stat(logfile).st_mtime < time.time() - self.config['scantime']:
+        if mtime < time.time() - self.config['scantime']:
             _debug("Skipped: mtime < curtime - scantime")
             return False
 
@@ -202,27 +215,31 @@ class LogChecker(object):
         """
         if negative:
             if critical:
-                pattern_list = self.config['critical_negpattern_list']
                 pattern_type = "critical_negpattern"
             else:
-                pattern_list = self.config['negpattern_list']
                 pattern_type = "negpattern"
         else:
             if critical:
-                pattern_list = self.config['critical_pattern_list']
                 pattern_type = "critical_pattern"
             else:
-                pattern_list = self.config['pattern_list']
                 pattern_type = "pattern"
 
-        if not pattern_list:
-            return False
-        for pattern in pattern_list:
-            if not pattern:
-                continue
-            matchobj = re.search(pattern, message, self.pattern_flags)
-            if matchobj:
-                _debug("{0}: '{1}' found".format(pattern_type, pattern))
+        matchers = self.pattern_matchers[pattern_type]
+        for pattern, re_pattern, sources in matchers:
+            if re_pattern is None:
+                # literal string
+                found = pattern in message
+            else:
+                found = re_pattern.search(message)
+            if found:
+                if not __debug__:
+                    # name the pattern given by the user, not the combined one.
+                    for source in sources:
+                        if len(sources) == 1 or re.search(
+                                source, message, self.pattern_flags):
+                            _debug("{0}: '{1}' found".format(
+                                pattern_type, source))
+                            break
                 return True
         return False
 
@@ -247,9 +264,13 @@ class LogChecker(object):
                 re.sub(r'[^-0-9A-Za-z*?]', '_', logfile_pattern) +
                 tag + LogChecker._SUFFIX_SEEK)
             for seekfile in glob.glob(seekfile_pattern):
-                if not os.path.isfile(seekfile):
+                try:
+                    seekfile_stat = os.stat(seekfile)
+                except OSError:
                     continue
-                if curtime - self.config['expiration'] <= os.stat(seekfile).st_mtime:
+                if not stat.S_ISREG(seekfile_stat.st_mode):
+                    continue
+                if curtime - self.config['expiration'] <= seekfile_stat.st_mtime:
                     continue
                 try:
                     _debug("remove seekfile: {0}".format(seekfile))
@@ -288,9 +309,13 @@ class LogChecker(object):
         seekfile_pattern = "{0}.[0-9]*{1}{2}".format(
             prefix, tag, LogChecker._SUFFIX_SEEK_WITH_INODE)
         for seekfile in glob.glob(seekfile_pattern):
-            if not os.path.isfile(seekfile):
+            try:
+                seekfile_stat = os.stat(seekfile)
+            except OSError:
                 continue
-            if curtime - self.config['expiration'] <= os.stat(seekfile).st_mtime:
+            if not stat.S_ISREG(seekfile_stat.st_mode):
+                continue
+            if curtime - self.config['expiration'] <= seekfile_stat.st_mtime:
                 continue
             try:
                 _debug("remove seekfile: {0}".format(seekfile))
@@ -397,6 +422,7 @@ class LogChecker(object):
         with io.open(logfile, mode='r', encoding=self.config['encoding'],
                      errors='replace') as fileobj:
             fileobj.seek(start_position, 0)
+            LogChecker._advise_sequential(fileobj, start_position)
 
             for line in fileobj:
                 line = line.rstrip()
@@ -429,7 +455,6 @@ class LogChecker(object):
                 previous_header = header
                 messages.append(message)
             end_position = fileobj.tell()
-            fileobj.close()
 
         # flush
         if messages:
@@ -442,6 +467,7 @@ class LogChecker(object):
         with io.open(logfile, mode='r', encoding=self.config['encoding'],
                      errors='replace') as fileobj:
             fileobj.seek(start_position, 0)
+            LogChecker._advise_sequential(fileobj, start_position)
 
             for line in fileobj:
                 line = line.rstrip()
@@ -465,9 +491,19 @@ class LogChecker(object):
 
                 self._set_found(header, message, found, critical_found)
             end_position = fileobj.tell()
-            fileobj.close()
         return end_position
 
+    @staticmethod
+    def _advise_sequential(fileobj, offset):
+        """Advise the kernel that the log file is read sequentially."""
+        if not hasattr(os, 'posix_fadvise'):
+            return
+        try:
+            os.posix_fadvise(
+                fileobj.fileno(), offset, 0, os.POSIX_FADV_SEQUENTIAL)
+        except OSError:
+            pass
+
     def _create_digest_condition(self, logfile_pattern):
         """Create the digest of search conditions."""
         strings = []
@@ -492,7 +528,16 @@ class LogChecker(object):
 
     def _create_seek_filename(
             self, logfile_pattern, logfile, trace_inode=False, tag=''):
-        """Return the file name of seek file."""
+        """Return the file name of seek file.
+
+        The file name without the inode depends only on the arguments,
+        so it is cached.
+        """
+        if not trace_inode:
+            cache_key = (logfile, tag)
+            if cache_key in self._seekfile_cache:
+                return self._seekfile_cache[cache_key]
+
         prefix = None
         filename = None
         if trace_inode:
@@ -505,6 +550,8 @@ class LogChecker(object):
         if prefix:
             filename = prefix + '.' + filename
         seekfile = os.path.join(self.config['state_directory'], filename)
+        if not trace_inode:
+            self._seekfile_cache[cache_key] = seekfile
         return seekfile
 
     def _create_cache_filename(self, logfile_pattern, tag=''):
@@ -612,14 +659,17 @@ class LogChecker(object):
         """
         _debug("logfile='{0}', seekfile='{1}'".format(logfile, seekfile))
         logfile = LogChecker.to_unicode(logfile)
-        if not os.path.exists(logfile):
+        try:
+            logfile_stat = os.stat(logfile)
+        except OSError:
             return
 
-        filesize = os.path.getsize(logfile)
+        filesize = logfile_stat.st_size
         # define seek positions.
         start_position = LogChecker._read_seekfile(seekfile)
         end_position = 0
-        if not self._check_updated(logfile, start_position, filesize):
+        if not self._check_updated(
+                logfile_stat.st_mtime, start_position, filesize):
             return
 
         # if log was rotated, set start_position.
@@ -736,14 +786,15 @@ class LogChecker(object):
         if self.config['dry_run']:
             return LogChecker.STATE_NO_CACHE, None
 
-        if not os.path.exists(cachefile):
+        try:
+            cachefile_mtime = os.stat(cachefile).st_mtime
+        except OSError:
             return LogChecker.STATE_NO_CACHE, None
-        if os.stat(cachefile).st_mtime < time.time() - self.config['cachetime']:
+        if cachefile_mtime < time.time() - self.config['cachetime']:
             _debug("Cache is expired: mtime < curtime - cachetime")
             return LogChecker.STATE_NO_CACHE, None
         with io.open(cachefile, mode='r', encoding='utf-8') as fileobj:
             line = fileobj.readline()
-            fileobj.close()
         state, message = line.split("\t", 1)
         _debug("cache: state={0}, message='{1}'".format(state, message))
         return int(state), message
@@ -755,11 +806,8 @@ class LogChecker(object):
 
         tmp_cachefile = cachefile + "." + str(os.getpid())
         with io.open(tmp_cachefile, mode='w', encoding='utf-8') as cachefileobj:
-            cachefileobj.write(LogChecker.to_unicode(str(self.get_state())))
-            cachefileobj.write("\t")
-            cachefileobj.write(self.get_message())
-            cachefileobj.flush()
-            cachefileobj.close()
+            cachefileobj.write("{0}\t{1}".format(
+                self.get_state(), self.get_message()))
         os.rename(tmp_cachefile, cachefile)
         return True
 
@@ -768,8 +816,10 @@ class LogChecker(object):
         if self.config['dry_run']:
             return True
 
-        if os.path.isfile(cachefile):
+        try:
             os.unlink(cachefile)
+        except OSError:
+            pass
 
     @staticmethod
     def get_pattern_list(pattern_string, pattern_filename):
@@ -806,7 +856,6 @@ class LogChecker(object):
                             pattern = line.rstrip()
                             if pattern:
                                 lines.append(pattern)
-                        fileobj.close()
                 except UnicodeDecodeError:
                     LogChecker.print_message("The character encoding of the pattern file is incorrect: {0}. Save its character encoding as UTF-8.".format(pattern_filename))
                     sys.exit(LogChecker.STATE_UNKNOWN)
@@ -817,6 +866,57 @@ class LogChecker(object):
                 sys.exit(LogChecker.STATE_UNKNOWN)
         return pattern_list
 
+    @staticmethod
+    def _compile_pattern_list(pattern_list, flags=0):
+        """Compile the list of patterns.
+
+        A pattern without metacharacters is kept as a literal string and is
+        matched by a substring search instead of a regular expression,
+        unless the flags are given.
+        The other patterns are grouped by the leading character and each
+        group is combined into one regular expression by alternation,
+        except for patterns with groups or inline flags.
+
+        Args:
+            pattern_list (list): The list of regular expressions.
+            flags (int, optional): The flags of regular expressions.
+
+        Returns:
+            The list of tuples of the pattern, its compiled regular expression
+            and the tuple of the original patterns combined into it.
+            The compiled regular expression is None if the pattern is a literal
+            string. Empty patterns are skipped.
+
+        """
+        matchers = []
+        buckets = []
+        bucket_index = {}
+        for pattern in pattern_list:
+            if not pattern:
+                continue
+            if not flags and re.escape(pattern) == pattern:
+                matchers.append((pattern, None, (pattern,)))
+                continue
+            re_pattern = re.compile(pattern, flags)
+            if re_pattern.groups or LogChecker._RE_INLINE_FLAGS.search(pattern):
+                # Combining would change group numbers or flags.
+                matchers.append((pattern, re_pattern, (pattern,)))
+                continue
+            if pattern[0] not in bucket_index:
+                bucket_index[pattern[0]] = len(buckets)
+                buckets.append([])
+            buckets[bucket_index[pattern[0]]].append((pattern, re_pattern))
+
+        for bucket in buckets:
+            if len(bucket) == 1:
+                pattern, re_pattern = bucket[0]
+                matchers.append((pattern, re_pattern, (pattern,)))
+                continue
+            sources = tuple([x[0] for x in bucket])
+            pattern = '|'.join(['(?:{0})'.format(x) for x in sources])
+            matchers.append((pattern, re.compile(pattern, flags), sources))
+        return matchers
+
     @staticmethod
     def _expand_logformat_by_strftime(logformat):
         """Expand log format by strftime variables.
@@ -839,21 +939,22 @@ class LogChecker(object):
             return True
 
         tmp_seekfile = seekfile + "." + str(os.getpid())
-        with io.open(tmp_seekfile, mode='w', encoding='utf-8') as fileobj:
-            fileobj.write(LogChecker.to_unicode(str(position)))
-            fileobj.flush()
-            fileobj.close()
+        with io.open(tmp_seekfile, mode='wb') as fileobj:
+            fileobj.write(str(position).encode('ascii'))
         os.rename(tmp_seekfile, seekfile)
         return True
 
     @staticmethod
     def _read_seekfile(seekfile):
         """Read the offset of the log file from its seek file."""
-        if not os.path.exists(seekfile):
-            return 0
-        with io.open(seekfile, mode='r', encoding='utf-8') as fileobj:
+        try:
+            fileobj = io.open(seekfile, mode='rb')
+        except IOError as ex:
+            if ex.errno == errno.ENOENT:
+                return 0
+            raise
+        with fileobj:
             offset = int(fileobj.readline())
-            fileobj.close()
         return offset
 
     @staticmethod
@@ -892,7 +993,6 @@ class LogChecker(object):
             fcntl.flock(lockfileobj, fcntl.LOCK_EX | fcntl.LOCK_NB)
         except IOError:
             return None
-        lockfileobj.flush()
         return lockfileobj
 
     @staticmethod
@@ -910,8 +1010,10 @@ class LogChecker(object):
         if lockfileobj is None:
             return False
         lockfileobj.close()
-        if os.path.isfile(lockfile):
+        try:
             os.unlink(lockfile)
+        except OSError:
+            pass
         return True
 
     @staticmethod
@@ -1008,7 +1110,6 @@ class LogChecker(object):
         with io.open(sys.stdout.fileno(), mode='w', encoding='utf-8') as fileobj:
             fileobj.write(string)
             fileobj.write('\n')
-            fileobj.close()
 
 
 def _debug(string):
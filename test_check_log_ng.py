@@ -7,15 +7,29 @@ from __future__ import division
 from __future__ import print_function
 from __future__ import unicode_literals
 import unittest
+import contextlib
 import warnings
 import os
-import glob
-import io
+import re
+import shutil
+import sys
+import tempfile
+import threading
 import time
-import datetime
-import subprocess
+import fcntl
 from check_log_ng import LogChecker
 
+# Use a RAM-backed filesystem on Linux if available.
+if sys.platform.startswith('linux') and os.path.isdir('/dev/shm'):
+    _TEMP_ROOT = '/dev/shm'
+else:
+    _TEMP_ROOT = None
+
+
+@contextlib.contextmanager
+def _null_context():
+    yield
+
 
 class LogCheckerTestCase(unittest.TestCase):
 
@@ -23,49 +37,72 @@ class LogCheckerTestCase(unittest.TestCase):
 
     # Class constant
     MESSAGE_OK = "OK - No matches found."
-    MESSAGE_WARNING_ONE = "WARNING: Found 1 lines (limit=1/0): {0} at {1}"
-    MESSAGE_WARNING_ONE_WITH_QUIET = "WARNING: Found 1 lines (limit=1/0, QUIET): at {0}"
-    MESSAGE_WARNING_ONE_WITH_HEADER = "WARNING: Found 1 lines (limit=1/0, HEADER): {0} at {1}"
-    MESSAGE_WARNING_TWO = "WARNING: Found 2 lines (limit=1/0): {0},{1} at {2}"
-    MESSAGE_WARNING_TWO_WITH_QUIET = "WARNING: Found 2 lines (limit=1/0, QUIET): at {0}"
-    MESSAGE_WARNING_TWO_WITH_HEADER = "WARNING: Found 2 lines (limit=1/0, HEADER): {0},{1} at {2}"
-    MESSAGE_WARNING_TWO_IN_TWO_FILES = (
-        "WARNING: Found 2 lines (limit=1/0): {0} at {1},{2} at {3}")
-    MESSAGE_CRITICAL_ONE = "CRITICAL: Critical Found 1 lines: {0} at {1}"
-    MESSAGE_CRITICAL_ONE_WITH_QUIET = "CRITICAL: Critical Found 1 lines (QUIET): at {0}"
-    MESSAGE_CRITICAL_ONE_WITH_HEADER = "CRITICAL: Critical Found 1 lines (HEADER): {0} at {1}"
     MESSAGE_UNKNOWN_LOCK_TIMEOUT = (
         "UNKNOWN: Lock timeout. Another process is running.")
 
-    # Class variablesex
-    BASEDIR = None
-    TESTDIR = None
-    LOGDIR = None
-    STATEDIR = None
-
-    @classmethod
-    def setUpClass(cls):
-        cls.BASEDIR = os.getcwd()
-        cls.TESTDIR = os.path.join(cls.BASEDIR, 'test')
-        cls.LOGDIR = os.path.join(cls.TESTDIR, 'log')
-        cls.STATEDIR = os.path.join(cls.TESTDIR, 'state')
-        if not os.path.isdir(cls.TESTDIR):
-            os.mkdir(cls.TESTDIR)
-        if not os.path.isdir(cls.LOGDIR):
-            os.mkdir(cls.LOGDIR)
-        if not os.path.isdir(cls.STATEDIR):
-            os.mkdir(cls.STATEDIR)
-
-    @classmethod
-    def tearDownClass(cls):
-        if os.path.exists(cls.LOGDIR):
-            os.removedirs(cls.LOGDIR)
-        if os.path.exists(cls.STATEDIR):
-            os.removedirs(cls.STATEDIR)
-        if os.path.exists(cls.TESTDIR):
-            os.removedirs(cls.TESTDIR)
+    # The lines written around test lines. Only their format matters.
+    NOOP_LINE = "Jan  1 00:00:00 hostname noop: NOOP"
+    CUSTOMIZED_NOOP_LINE = "[Mon Jan 01 00:00:00 2018] [info] NOOP"
+
+    # Expected messages
+    @staticmethod
+    def _warn1(line, logfile):
+        return "WARNING: Found 1 lines (limit=1/0): " + line + " at " + logfile
+
+    @staticmethod
+    def _warn1_quiet(logfile):
+        return "WARNING: Found 1 lines (limit=1/0, QUIET): at " + logfile
+
+    @staticmethod
+    def _warn1_header(header, logfile):
+        return ("WARNING: Found 1 lines (limit=1/0, HEADER): " +
+                header + " at " + logfile)
+
+    @staticmethod
+    def _warn2(line1, line2, logfile):
+        return ("WARNING: Found 2 lines (limit=1/0): " +
+                line1 + "," + line2 + " at " + logfile)
+
+    @staticmethod
+    def _warn2_quiet(logfile):
+        return "WARNING: Found 2 lines (limit=1/0, QUIET): at " + logfile
+
+    @staticmethod
+    def _warn2_header(header1, header2, logfile):
+        return ("WARNING: Found 2 lines (limit=1/0, HEADER): " +
+                header1 + "," + header2 + " at " + logfile)
+
+    @staticmethod
+    def _warn2in2(line1, logfile1, line2, logfile2):
+        return ("WARNING: Found 2 lines (limit=1/0): " +
+                line1 + " at " + logfile1 + "," + line2 + " at " + logfile2)
+
+    @staticmethod
+    def _crit1(line, logfile):
+        return "CRITICAL: Critical Found 1 lines: " + line + " at " + logfile
+
+    @staticmethod
+    def _crit1_quiet(logfile):
+        return "CRITICAL: Critical Found 1 lines (QUIET): at " + logfile
+
+    @staticmethod
+    def _crit1_header(header, logfile):
+        return ("CRITICAL: Critical Found 1 lines (HEADER): " +
+                header + " at " + logfile)
+
+    # Class variables
+    _TIMESTAMP_CACHE = {}
 
     def setUp(self):
+        # directories
+        # Each test has its own directory, so that tests can run in
+        # parallel, e.g. with "pytest -n auto".
+        self._td = tempfile.mkdtemp(prefix="clt-", dir=_TEMP_ROOT)
+        self.LOGDIR = os.path.join(self._td, 'log')
+        self.STATEDIR = os.path.join(self._td, 'state')
+        os.mkdir(self.LOGDIR)
+        os.mkdir(self.STATEDIR)
+
         # log files
         self.logfile = os.path.join(self.LOGDIR, 'testlog')
         self.logfile1 = os.path.join(self.LOGDIR, 'testlog.1')
@@ -83,6 +120,7 @@ class LogCheckerTestCase(unittest.TestCase):
         # configuration
         # Set cachetime to 0 for convenience in testing.
         self.config = {
+            "dry_run": False,
             "logformat": LogChecker.FORMAT_SYSLOG,
             "state_directory": self.STATEDIR,
             "pattern_list": [],
@@ -100,39 +138,20 @@ class LogCheckerTestCase(unittest.TestCase):
             "cachetime": 0,
             "lock_timeout": 3
         }
+        self._checkers = {}
+        self._logfds = {}
 
     def tearDown(self):
-        # remove log files.
-        for logfile in [self.logfile, self.logfile1, self.logfile2]:
-            if os.path.exists(logfile):
-                os.unlink(logfile)
-
-        # remove seek files.
-        seekfiles = glob.glob(
-            os.path.join(self.STATEDIR, '*' + LogChecker._SUFFIX_SEEK))
-        for seekfile in seekfiles:
-            if os.path.exists(seekfile):
-                os.unlink(seekfile)
-
-        # remove a cache file.
-        cachefiles = glob.glob(
-            os.path.join(self.STATEDIR, '*' + LogChecker._SUFFIX_CACHE))
-        for cachefile in cachefiles:
-            if os.path.exists(cachefile):
-                os.unlink(cachefile)
-
-        # remove a lock file.
-        lockfiles = glob.glob(
-            os.path.join(self.STATEDIR, '*' + LogChecker._SUFFIX_LOCK))
-        for lockfile in lockfiles:
-            if os.path.exists(lockfile):
-                os.unlink(lockfile)
+        for fd in self._logfds.values():
+            os.close(fd)
+
+        # remove log files, seek files, cache files and lock files.
+        shutil.rmtree(self._td, ignore_errors=True)
 
     def test_dry_run(self):
         """--dry-run option
         """
-        self.config["pattern_list"] = ["ERROR"]
-        log = LogChecker(self.config)
+        log = self._get_checker(pattern_list=["ERROR"])
 
         # create a seek file
         # Dec  5 12:34:50 hostname noop: NOOP
@@ -143,10 +162,12 @@ class LogCheckerTestCase(unittest.TestCase):
 
         self.assertEqual(log.get_state(), LogChecker.STATE_OK)
         self.assertEqual(log.get_message(), self.MESSAGE_OK)
+        seekfile = log._create_seek_filename(self.logfile, self.logfile)
+        offset = os.path.getsize(self.logfile)
+        self.assertEqual(LogChecker._read_seekfile(seekfile), offset)
 
         # verify a seek file is not updated.
-        self.config["dry_run"] = True
-        log = LogChecker(self.config)
+        log = self._get_checker(dry_run=True)
 
         # Dec  5 12:34:50 hostname test: ERROR
         line = self._make_line(self._get_timestamp(), "test", "ERROR")
@@ -158,22 +179,17 @@ class LogCheckerTestCase(unittest.TestCase):
         self.assertEqual(log.get_state(), LogChecker.STATE_WARNING)
         self.assertEqual(
             log.get_message(),
-            self.MESSAGE_WARNING_ONE.format(line, self.logfile))
-
-        log.clear_state()
-        log.check(self.logfile)
-
-        self.assertEqual(log.get_state(), LogChecker.STATE_WARNING)
+            self._warn1(line, self.logfile))
         self.assertEqual(
-            log.get_message(),
-            self.MESSAGE_WARNING_ONE.format(line, self.logfile))
+            log._create_seek_filename(self.logfile, self.logfile), seekfile)
+        self.assertEqual(LogChecker._read_seekfile(seekfile), offset)
 
     def test_format(self):
         """--format option
         """
-        self.config["logformat"] = r"^(\[%a %b %d %T %Y\] \[\S+\] )(.*)$"
-        self.config["pattern_list"] = ["ERROR"]
-        log = LogChecker(self.config)
+        log = self._get_checker(
+            logformat=r"^(\[%a %b %d %T %Y\] \[\S+\] )(.*)$",
+            pattern_list=["ERROR"])
 
         # [Thu Dec 05 12:34:50 2013] [error] ERROR
         line = self._make_customized_line(
@@ -184,55 +200,117 @@ class LogCheckerTestCase(unittest.TestCase):
         self.assertEqual(log.get_state(), LogChecker.STATE_WARNING)
         self.assertEqual(
             log.get_message(),
-            self.MESSAGE_WARNING_ONE.format(line, self.logfile))
+            self._warn1(line, self.logfile))
 
-    def test_pattern(self):
-        """--pattern option
+    def test_pattern_matrix(self):
+        """--pattern, --critical-pattern, --negpattern, --critical-negpattern,
+        --case-insensitive and --encoding options
         """
-        self.config["pattern_list"] = ["ERROR"]
-        log = LogChecker(self.config)
-
-        # 1 line matched
-        # Dec  5 12:34:50 hostname test: ERROR
-        line1 = self._make_line(self._get_timestamp(), "test", "ERROR")
-        self._write_logfile(self.logfile, line1)
-        log.check(self.logfile)
-
-        self.assertEqual(log.get_state(), LogChecker.STATE_WARNING)
-        self.assertEqual(
-            log.get_message(),
-            self.MESSAGE_WARNING_ONE.format(line1, self.logfile))
-
-        # 2 lines matched
-        # Dec  5 12:34:50 hostname test: ERROR1
-        # Dec  5 12:34:50 hostname test: ERROR2
-        line2 = self._make_line(self._get_timestamp(), "test", "ERROR1")
-        line3 = self._make_line(self._get_timestamp(), "test", "ERROR2")
-        self._write_logfile(self.logfile, [line2, line3])
-        log.clear_state()
-        log.check(self.logfile)
-
-        self.assertEqual(log.get_state(), LogChecker.STATE_WARNING)
-        self.assertEqual(
-            log.get_message(),
-            self.MESSAGE_WARNING_TWO.format(line2, line3, self.logfile))
-
-        # no line matched
-        # Dec  5 12:34:50 hostname noop: NOOP
-        line4 = self._make_line(self._get_timestamp(), "noop", "NOOP")
-        self._write_logfile(self.logfile, line4)
-        log.clear_state()
-        log.check(self.logfile)
-
-        self.assertEqual(log.get_state(), LogChecker.STATE_OK)
-        self.assertEqual(log.get_message(), self.MESSAGE_OK)
+        base_config = dict(self.config)
+        # (overrides, messages, expected state, expected message or None)
+        cases = [
+            # --pattern
+            ({"pattern_list": ["ERROR"]},
+             ["ERROR"],
+             LogChecker.STATE_WARNING, self._warn1),
+            ({"pattern_list": ["ERROR"]},
+             ["ERROR1", "ERROR2"],
+             LogChecker.STATE_WARNING, self._warn2),
+            ({"pattern_list": ["ERROR"]},
+             ["NOOP"],
+             LogChecker.STATE_OK, None),
+            ({"pattern_list": ["ERR(OR|OO)"]},
+             ["ERROO"],
+             LogChecker.STATE_WARNING, self._warn1),
+            # --critical-pattern
+            ({"critical_pattern_list": ["FATAL"]},
+             ["FATAL"],
+             LogChecker.STATE_CRITICAL, self._crit1),
+            # --negpattern
+            ({"pattern_list": ["ERROR"],
+              "critical_pattern_list": ["FATAL"],
+              "negpattern_list": ["IGNORE"]},
+             ["ERROR IGNORE"],
+             LogChecker.STATE_OK, None),
+            ({"pattern_list": ["ERROR"],
+              "critical_pattern_list": ["FATAL"],
+              "negpattern_list": ["IGNORE"]},
+             ["FATAL IGNORE"],
+             LogChecker.STATE_CRITICAL, self._crit1),
+            # --critical-negpattern
+            ({"pattern_list": ["ERROR"],
+              "critical_pattern_list": ["FATAL"],
+              "critical_negpattern_list": ["IGNORE"]},
+             ["ERROR IGNORE"],
+             LogChecker.STATE_OK, None),
+            ({"pattern_list": ["ERROR"],
+              "critical_pattern_list": ["FATAL"],
+              "critical_negpattern_list": ["IGNORE"]},
+             ["FATAL IGNORE"],
+             LogChecker.STATE_OK, None),
+            ({"pattern_list": ["ERROR"],
+              "critical_pattern_list": ["FATAL"],
+              "critical_negpattern_list": ["IGNORE"]},
+             ["ERROR FATAL IGNORE"],
+             LogChecker.STATE_OK, None),
+            # --case-insensitive
+            ({"pattern_list": ["error"],
+              "critical_pattern_list": ["fatal"],
+              "negpattern_list": ["ignore"],
+              "case_insensitive": True},
+             ["ERROR"],
+             LogChecker.STATE_WARNING, self._warn1),
+            ({"pattern_list": ["error"],
+              "critical_pattern_list": ["fatal"],
+              "negpattern_list": ["ignore"],
+              "case_insensitive": True},
+             ["FATAL"],
+             LogChecker.STATE_CRITICAL, self._crit1),
+            ({"pattern_list": ["error"],
+              "critical_pattern_list": ["fatal"],
+              "negpattern_list": ["ignore"],
+              "case_insensitive": True},
+             ["ERROR IGNORE"],
+             LogChecker.STATE_OK, None),
+            # --encoding
+            ({"pattern_list": ["エラー"], "encoding": "EUC-JP"},
+             ["エラー"],
+             LogChecker.STATE_WARNING, self._warn1),
+            # replace pipe symbol
+            ({"pattern_list": ["ERROR"]},
+             ["ERROR |"],
+             LogChecker.STATE_WARNING, self._warn1),
+        ]
+
+        # Each case has its own log file, so that cases do not depend on
+        # each other.
+        for i, (overrides, messages, state, message) in enumerate(cases):
+            with self._sub_test(overrides=overrides, messages=messages):
+                self.config = dict(base_config)
+                log = self._get_checker(**overrides)
+                logfile = os.path.join(self.LOGDIR, 'testlog{0}'.format(i))
+
+                # Dec  5 12:34:50 hostname test: ERROR
+                timestamp = self._get_timestamp()
+                lines = [
+                    self._make_line(timestamp, "test", x) for x in messages]
+                self._write_logfile(
+                    logfile, lines, encoding=self.config["encoding"])
+                log.check(logfile)
+
+                if message is None:
+                    expected_message = self.MESSAGE_OK
+                else:
+                    expected_message = message(*(lines + [logfile]))
+                self.assertEqual(log.get_state(), state)
+                self.assertEqual(
+                    log.get_message(),
+                    expected_message.replace("|", "(pipe)"))
 
     def test_pattern_with_quiet(self):
         """--pattern and --quiet options
         """
-        self.config["pattern_list"] = ["ERROR"]
-        self.config['output_quiet'] = True
-        log = LogChecker(self.config)
+        log = self._get_checker(pattern_list=["ERROR"], output_quiet=True)
 
         # 1 line matched
         # Dec  5 12:34:50 hostname test: ERROR
@@ -243,7 +321,7 @@ class LogCheckerTestCase(unittest.TestCase):
         self.assertEqual(log.get_state(), LogChecker.STATE_WARNING)
         self.assertEqual(
             log.get_message(),
-            self.MESSAGE_WARNING_ONE_WITH_QUIET.format(self.logfile))
+            self._warn1_quiet(self.logfile))
 
         # 2 lines matched
         # Dec  5 12:34:50 hostname test: ERROR1
@@ -257,7 +335,7 @@ class LogCheckerTestCase(unittest.TestCase):
         self.assertEqual(log.get_state(), LogChecker.STATE_WARNING)
         self.assertEqual(
             log.get_message(),
-            self.MESSAGE_WARNING_TWO_WITH_QUIET.format(self.logfile))
+            self._warn2_quiet(self.logfile))
 
         # no line matched
         # Dec  5 12:34:50 hostname noop: NOOP
@@ -272,9 +350,7 @@ class LogCheckerTestCase(unittest.TestCase):
     def test_pattern_with_header(self):
         """--pattern and --header options
         """
-        self.config["pattern_list"] = ["ERROR"]
-        self.config['output_header'] = True
-        log = LogChecker(self.config)
+        log = self._get_checker(pattern_list=["ERROR"], output_header=True)
 
         # 1 line matched
         # Dec  5 12:34:50 hostname test: ERROR
@@ -287,7 +363,7 @@ class LogCheckerTestCase(unittest.TestCase):
         self.assertEqual(log.get_state(), LogChecker.STATE_WARNING)
         self.assertEqual(
             log.get_message(),
-            self.MESSAGE_WARNING_ONE_WITH_HEADER.format(header1, self.logfile))
+            self._warn1_header(header1, self.logfile))
 
         # 2 lines matched
         # Dec  5 12:34:50 hostname test: ERROR1
@@ -304,7 +380,7 @@ class LogCheckerTestCase(unittest.TestCase):
         self.assertEqual(log.get_state(), LogChecker.STATE_WARNING)
         self.assertEqual(
             log.get_message(),
-            self.MESSAGE_WARNING_TWO_WITH_HEADER.format(header2, header3, self.logfile))
+            self._warn2_header(header2, header3, self.logfile))
 
         # no line matched
         # Dec  5 12:34:50 hostname noop: NOOP
@@ -316,28 +392,12 @@ class LogCheckerTestCase(unittest.TestCase):
         self.assertEqual(log.get_state(), LogChecker.STATE_OK)
         self.assertEqual(log.get_message(), self.MESSAGE_OK)
 
-    def test_critical_pattern(self):
-        """--critical-pattern option
-        """
-        self.config["critical_pattern_list"] = ["FATAL"]
-        log = LogChecker(self.config)
-
-        # Dec  5 12:34:50 hostname test: FATAL
-        line = self._make_line(self._get_timestamp(), "test", "FATAL")
-        self._write_logfile(self.logfile, line)
-        log.check(self.logfile)
-
-        self.assertEqual(log.get_state(), LogChecker.STATE_CRITICAL)
-        self.assertEqual(
-            log.get_message(),
-            self.MESSAGE_CRITICAL_ONE.format(line, self.logfile))
-
     def test_critical_pattern_with_quiet(self):
         """--critical-pattern and --quiet options
         """
-        self.config["critical_pattern_list"] = ["FATAL"]
-        self.config['output_quiet'] = True
-        log = LogChecker(self.config)
+        log = self._get_checker(
+            critical_pattern_list=["FATAL"],
+            output_quiet=True)
 
         # Dec  5 12:34:50 hostname test: FATAL
         line = self._make_line(self._get_timestamp(), "test", "FATAL")
@@ -347,14 +407,14 @@ class LogCheckerTestCase(unittest.TestCase):
         self.assertEqual(log.get_state(), LogChecker.STATE_CRITICAL)
         self.assertEqual(
             log.get_message(),
-            self.MESSAGE_CRITICAL_ONE_WITH_QUIET.format(self.logfile))
+            self._crit1_quiet(self.logfile))
 
     def test_critical_pattern_with_header(self):
         """--critical-pattern and --header options
         """
-        self.config["critical_pattern_list"] = ["FATAL"]
-        self.config['output_header'] = True
-        log = LogChecker(self.config)
+        log = self._get_checker(
+            critical_pattern_list=["FATAL"],
+            output_header=True)
 
         # Dec  5 12:34:50 hostname test: FATAL
         timestamp = self._get_timestamp()
@@ -366,143 +426,15 @@ class LogCheckerTestCase(unittest.TestCase):
         self.assertEqual(log.get_state(), LogChecker.STATE_CRITICAL)
         self.assertEqual(
             log.get_message(),
-            self.MESSAGE_CRITICAL_ONE_WITH_HEADER.format(header, self.logfile))
-
-    def test_negpattern(self):
-        """--negpattern option
-        """
-        self.config["pattern_list"] = ["ERROR"]
-        self.config["critical_pattern_list"] = ["FATAL"]
-        self.config["negpattern_list"] = ["IGNORE"]
-        log = LogChecker(self.config)
-
-        # check --pattern
-        # Dec  5 12:34:50 hostname test: ERROR IGNORE
-        line1 = self._make_line(self._get_timestamp(), "test", "ERROR IGNORE")
-        self._write_logfile(self.logfile, line1)
-        log.check(self.logfile)
-
-        self.assertEqual(log.get_state(), LogChecker.STATE_OK)
-        self.assertEqual(log.get_message(), self.MESSAGE_OK)
-
-        # check --critical-pattern
-        # Dec  5 12:34:50 hostname test: FATAL IGNORE
-        line2 = self._make_line(self._get_timestamp(), "test", "FATAL IGNORE")
-        self._write_logfile(self.logfile, line2)
-        log.clear_state()
-        log.check(self.logfile)
-
-        self.assertEqual(log.get_state(), LogChecker.STATE_CRITICAL)
-        self.assertEqual(
-            log.get_message(),
-            self.MESSAGE_CRITICAL_ONE.format(line2, self.logfile))
-
-    def test_critical_negpattern(self):
-        """--critical-negpattern option
-        """
-        self.config["pattern_list"] = ["ERROR"]
-        self.config["critical_pattern_list"] = ["FATAL"]
-        self.config["critical_negpattern_list"] = ["IGNORE"]
-        log = LogChecker(self.config)
-
-        # check --pattern and --critical-negpattern
-        # Dec  5 12:34:50 hostname test: ERROR IGNORE
-        line1 = self._make_line(self._get_timestamp(), "test", "ERROR IGNORE")
-        self._write_logfile(self.logfile, line1)
-        log.check(self.logfile)
-
-        self.assertEqual(log.get_state(), LogChecker.STATE_OK)
-        self.assertEqual(log.get_message(), self.MESSAGE_OK)
-
-        # check --critical-pattern and --ciritical-negpattern
-        # Dec  5 12:34:50 hostname test: FATAL IGNORE
-        line2 = self._make_line(self._get_timestamp(), "test", "FATAL IGNORE")
-        self._write_logfile(self.logfile, line2)
-        log.clear_state()
-        log.check(self.logfile)
-
-        self.assertEqual(log.get_state(), LogChecker.STATE_OK)
-        self.assertEqual(log.get_message(), self.MESSAGE_OK)
-
-        # check --pattern, --critical-pattern and --critical-negpattern
-        # Dec  5 12:34:50 hostname test: ERROR FATAL IGNORE
-        line3 = self._make_line(
-            self._get_timestamp(), "test", "ERROR FATAL IGNORE")
-        self._write_logfile(self.logfile, line3)
-        log.clear_state()
-        log.check(self.logfile)
-
-        self.assertEqual(log.get_state(), LogChecker.STATE_OK)
-        self.assertEqual(log.get_message(), self.MESSAGE_OK)
-
-    def test_case_insensitive(self):
-        """--case-insensitive option
-        """
-        self.config["pattern_list"] = ["error"]
-        self.config["critical_pattern_list"] = ["fatal"]
-        self.config["negpattern_list"] = ["ignore"]
-        self.config["case_insensitive"] = True
-        log = LogChecker(self.config)
-
-        # check --pattern
-        # Dec  5 12:34:50 hostname test: ERROR
-        line1 = self._make_line(self._get_timestamp(), "test", "ERROR")
-        self._write_logfile(self.logfile, line1)
-        log.clear_state()
-        log.check(self.logfile)
-
-        self.assertEqual(log.get_state(), LogChecker.STATE_WARNING)
-        self.assertEqual(
-            log.get_message(),
-            self.MESSAGE_WARNING_ONE.format(line1, self.logfile))
-
-        # check --critical-pattern
-        # Dec  5 12:34:50 hostname test: FATAL
-        line2 = self._make_line(self._get_timestamp(), "test", "FATAL")
-        self._write_logfile(self.logfile, line2)
-        log.clear_state()
-        log.check(self.logfile)
-
-        self.assertEqual(log.get_state(), LogChecker.STATE_CRITICAL)
-        self.assertEqual(
-            log.get_message(),
-            self.MESSAGE_CRITICAL_ONE.format(line2, self.logfile))
-
-        # check --pattern and --negpattern
-        # Dec  5 12:34:50 hostname test: ERROR ERROR IGNORE
-        line3 = self._make_line(self._get_timestamp(), "test", "ERROR IGNORE")
-        self._write_logfile(self.logfile, line3)
-        log.clear_state()
-        log.check(self.logfile)
-
-        self.assertEqual(log.get_state(), LogChecker.STATE_OK)
-        self.assertEqual(log.get_message(), self.MESSAGE_OK)
-
-    def test_encoding(self):
-        """--pattern and --encoding
-        """
-        self.config["pattern_list"] = ["エラー"]
-        self.config["encoding"] = "EUC-JP"
-        log = LogChecker(self.config)
-
-        # Dec  5 12:34:50 hostname test: エラー
-        line = self._make_line(self._get_timestamp(), "test", "エラー")
-        self._write_logfile(self.logfile, line, encoding='EUC-JP')
-        log.clear_state()
-        log.check(self.logfile)
-
-        self.assertEqual(log.get_state(), LogChecker.STATE_WARNING)
-        self.assertEqual(
-            log.get_message(),
-            self.MESSAGE_WARNING_ONE.format(line, self.logfile))
+            self._crit1_header(header, self.logfile))
 
     def test_multiline(self):
         """--multiline
         """
-        self.config["pattern_list"] = ["ERROR1.*ERROR2"]
-        self.config["negpattern_list"] = ["IGNORE"]
-        self.config["multiline"] = True
-        log = LogChecker(self.config)
+        log = self._get_checker(
+            pattern_list=["ERROR1.*ERROR2"],
+            negpattern_list=["IGNORE"],
+            multiline=True)
 
         # check --pattern, --multiline
         # Dec  5 12:34:50 hostname test: ERROR1
@@ -520,7 +452,7 @@ class LogCheckerTestCase(unittest.TestCase):
         self.assertEqual(log.get_state(), LogChecker.STATE_WARNING)
         self.assertEqual(
             log.get_message(),
-            self.MESSAGE_WARNING_ONE.format(
+            self._warn1(
                 lines[0] + " " + messages[1], self.logfile))
 
         # check --pattern, --negpattern and --multiline
@@ -542,36 +474,31 @@ class LogCheckerTestCase(unittest.TestCase):
     def test_logfile(self):
         """--logfile option
         """
-        self.config["pattern_list"] = ["ERROR"]
-        log = LogChecker(self.config)
+        log = self._get_checker(pattern_list=["ERROR"])
 
-        # check -logfile option with wild card '*'
         # Dec  5 12:34:50 hostname test: ERROR
         line1 = self._make_line(self._get_timestamp(), "test", "ERROR")
         self._write_logfile(self.logfile1, line1)
-        time.sleep(1)
+        self._advance(1)
 
         # Dec  5 12:34:51 hostname test: ERROR
         line2 = self._make_line(self._get_timestamp(), "test", "ERROR")
         self._write_logfile(self.logfile2, line2)
+
+        # check -logfile option with wild card '*'
         log.clear_state()
         log.check(self.logfile_pattern)
 
         self.assertEqual(log.get_state(), LogChecker.STATE_WARNING)
         self.assertEqual(
             log.get_message(),
-            self.MESSAGE_WARNING_TWO_IN_TWO_FILES.format(
+            self._warn2in2(
                 line1, self.logfile1, line2, self.logfile2))
 
         # --logfile option with multiple filenames
-        # Dec  5 12:34:51 hostname test: ERROR
-        line1 = self._make_line(self._get_timestamp(), "test", "ERROR")
-        self._write_logfile(self.logfile1, line1)
-        time.sleep(1)
-
-        # Dec  5 12:34:52 hostname test: ERROR
-        line2 = self._make_line(self._get_timestamp(), "test", "ERROR")
-        self._write_logfile(self.logfile2, line2)
+        # remove the seek files to check the same log files again.
+        shutil.rmtree(self.STATEDIR)
+        os.mkdir(self.STATEDIR)
         logfile_pattern = "{0} {1}".format(self.logfile1, self.logfile2)
         log.clear_state()
         log.check(logfile_pattern)
@@ -579,15 +506,13 @@ class LogCheckerTestCase(unittest.TestCase):
         self.assertEqual(log.get_state(), LogChecker.STATE_WARNING)
         self.assertEqual(
             log.get_message(),
-            self.MESSAGE_WARNING_TWO_IN_TWO_FILES.format(
+            self._warn2in2(
                 line1, self.logfile1, line2, self.logfile2))
 
     def test_trace_inode(self):
         """--trace_inode
         """
-        self.config["pattern_list"] = ["ERROR"]
-        self.config["trace_inode"] = True
-        log = LogChecker(self.config)
+        log = self._get_checker(pattern_list=["ERROR"], trace_inode=True)
 
         # within expiration
         # create logfile
@@ -606,7 +531,7 @@ class LogCheckerTestCase(unittest.TestCase):
         self._write_logfile(self.logfile, line2)
 
         # log rotation
-        os.rename(self.logfile, self.logfile1)
+        self._rotate_logfile(self.logfile, self.logfile1)
 
         # create a new logfile
         # Dec  5 12:34:52 hostname noop: NOOP
@@ -624,7 +549,7 @@ class LogCheckerTestCase(unittest.TestCase):
         self.assertEqual(log.get_state(), LogChecker.STATE_WARNING)
         self.assertEqual(
             log.get_message(),
-            self.MESSAGE_WARNING_ONE.format(line2, self.logfile1))
+            self._warn1(line2, self.logfile1))
         self.assertEqual(seekfile_1, seekfile1_2)
         self.assertTrue(os.path.exists(seekfile_2))
         self.assertTrue(os.path.exists(seekfile1_2))
@@ -632,9 +557,7 @@ class LogCheckerTestCase(unittest.TestCase):
     def test_scantime(self):
         """--scantime option
         """
-        self.config["pattern_list"] = ["ERROR"]
-        self.config["scantime"] = 2
-        log = LogChecker(self.config)
+        log = self._get_checker(pattern_list=["ERROR"], scantime=2)
 
         # within scantime.
         # Dec  5 12:34:50 hostname test: ERROR
@@ -646,13 +569,13 @@ class LogCheckerTestCase(unittest.TestCase):
         self.assertEqual(log.get_state(), LogChecker.STATE_WARNING)
         self.assertEqual(
             log.get_message(),
-            self.MESSAGE_WARNING_ONE.format(line1, self.logfile1))
+            self._warn1(line1, self.logfile1))
 
         # over scantime
         # Dec  5 12:34:50 hostname test: ERROR
         line2 = self._make_line(self._get_timestamp(), "test", "ERROR")
         self._write_logfile(self.logfile1, line2)
-        time.sleep(4)
+        self._advance(4)
         log.clear_state()
         log.check(self.logfile_pattern)
 
@@ -663,7 +586,7 @@ class LogCheckerTestCase(unittest.TestCase):
         # Dec  5 12:34:50 hostname test: ERROR
         line3 = self._make_line(self._get_timestamp(), "test", "ERROR")
         self._write_logfile(self.logfile1, line3)
-        time.sleep(4)
+        self._advance(4)
 
         # Dec  5 12:34:54 hostname test: ERROR
         line4 = self._make_line(self._get_timestamp(), "test", "ERROR")
@@ -676,15 +599,15 @@ class LogCheckerTestCase(unittest.TestCase):
         self.assertEqual(log.get_state(), LogChecker.STATE_WARNING)
         self.assertEqual(
             log.get_message(),
-            self.MESSAGE_WARNING_ONE.format(line4, self.logfile2))
+            self._warn1(line4, self.logfile2))
 
     def test_remove_seekfile(self):
         """--expiration and --remove-seekfile options
         """
-        self.config["pattern_list"] = ["ERROR"]
-        self.config["scantime"] = 2
-        self.config["expiration"] = 4
-        log = LogChecker(self.config)
+        log = self._get_checker(
+            pattern_list=["ERROR"],
+            scantime=2,
+            expiration=4)
 
         # within expiration
         # Dec  5 12:34:50 hostname test: ERROR
@@ -694,7 +617,7 @@ class LogCheckerTestCase(unittest.TestCase):
         log.check(self.logfile_pattern, remove_seekfile=True)
         self.seekfile1 = log._create_seek_filename(
             self.logfile_pattern, self.logfile1)
-        time.sleep(2)
+        self._advance(2)
 
         # Dec  5 12:34:54 hostname test: ERROR
         line2 = self._make_line(self._get_timestamp(), "test", "ERROR")
@@ -709,7 +632,7 @@ class LogCheckerTestCase(unittest.TestCase):
         self.assertEqual(log.get_state(), LogChecker.STATE_WARNING)
         self.assertEqual(
             log.get_message(),
-            self.MESSAGE_WARNING_ONE.format(line2, self.logfile2))
+            self._warn1(line2, self.logfile2))
         self.assertTrue(os.path.exists(self.seekfile1))
         self.assertTrue(os.path.exists(self.seekfile2))
 
@@ -719,7 +642,7 @@ class LogCheckerTestCase(unittest.TestCase):
         self._write_logfile(self.logfile1, line1)
 
         log.check(self.logfile_pattern, remove_seekfile=True)
-        time.sleep(6)
+        self._advance(6)
 
         # Dec  5 12:34:54 hostname test: ERROR
         line2 = self._make_line(self._get_timestamp(), "test", "ERROR")
@@ -732,17 +655,17 @@ class LogCheckerTestCase(unittest.TestCase):
         self.assertEqual(log.get_state(), LogChecker.STATE_WARNING)
         self.assertEqual(
             log.get_message(),
-            self.MESSAGE_WARNING_ONE.format(line2, self.logfile2))
+            self._warn1(line2, self.logfile2))
         self.assertFalse(os.path.exists(self.seekfile1))
         self.assertTrue(os.path.exists(self.seekfile2))
 
     def test_remove_seekfile_with_dry_run(self):
         """--expiration, --remove-seekfile, and --dry-run options
         """
-        self.config["pattern_list"] = ["ERROR"]
-        self.config["scantime"] = 2
-        self.config["expiration"] = 4
-        log = LogChecker(self.config)
+        log = self._get_checker(
+            pattern_list=["ERROR"],
+            scantime=2,
+            expiration=4)
 
         # within expiration
         # Dec  5 12:34:50 hostname test: ERROR
@@ -752,7 +675,7 @@ class LogCheckerTestCase(unittest.TestCase):
         log.check(self.logfile_pattern, remove_seekfile=True)
         self.seekfile1 = log._create_seek_filename(
             self.logfile_pattern, self.logfile1)
-        time.sleep(2)
+        self._advance(2)
 
         # Dec  5 12:34:54 hostname test: ERROR
         line2 = self._make_line(self._get_timestamp(), "test", "ERROR")
@@ -767,13 +690,12 @@ class LogCheckerTestCase(unittest.TestCase):
         self.assertEqual(log.get_state(), LogChecker.STATE_WARNING)
         self.assertEqual(
             log.get_message(),
-            self.MESSAGE_WARNING_ONE.format(line2, self.logfile2))
+            self._warn1(line2, self.logfile2))
         self.assertTrue(os.path.exists(self.seekfile1))
         self.assertTrue(os.path.exists(self.seekfile2))
 
         # with dry run
-        self.config["dry_run"] = True
-        log = LogChecker(self.config)
+        log = self._get_checker(dry_run=True)
 
         # over expiration
         # Dec  5 12:34:50 hostname test: ERROR
@@ -781,7 +703,7 @@ class LogCheckerTestCase(unittest.TestCase):
         self._write_logfile(self.logfile1, line1)
 
         log.check(self.logfile_pattern, remove_seekfile=True)
-        time.sleep(6)
+        self._advance(6)
 
         # Dec  5 12:34:54 hostname test: ERROR
         line2 = self._make_line(self._get_timestamp(), "test", "ERROR")
@@ -793,18 +715,18 @@ class LogCheckerTestCase(unittest.TestCase):
         self.assertEqual(log.get_state(), LogChecker.STATE_WARNING)
         self.assertEqual(
             log.get_message(),
-            self.MESSAGE_WARNING_ONE.format(line2, self.logfile2))
+            self._warn1(line2, self.logfile2))
         self.assertTrue(os.path.exists(self.seekfile1))
         self.assertTrue(os.path.exists(self.seekfile2))
 
     def test_remove_seekfile_inode(self):
         """--trace_inode, --expiration and --remove-seekfile options
         """
-        self.config["pattern_list"] = ["ERROR"]
-        self.config["trace_inode"] = True
-        self.config["scantime"] = 2
-        self.config["expiration"] = 3
-        log = LogChecker(self.config)
+        log = self._get_checker(
+            pattern_list=["ERROR"],
+            trace_inode=True,
+            scantime=2,
+            expiration=3)
 
         # create logfile
         # Dec  5 12:34:50 hostname test: ERROR
@@ -812,7 +734,7 @@ class LogCheckerTestCase(unittest.TestCase):
         self._write_logfile(self.logfile, line1)
 
         # log rotation
-        os.rename(self.logfile, self.logfile1)
+        self._rotate_logfile(self.logfile, self.logfile1)
 
         # create new logfile
         # Dec  5 12:34:50 hostname test: ERROR
@@ -826,7 +748,7 @@ class LogCheckerTestCase(unittest.TestCase):
             self.logfile_pattern, self.logfile, trace_inode=True)
         seekfile1_1 = log._create_seek_filename(
             self.logfile_pattern, self.logfile1, trace_inode=True)
-        time.sleep(4)
+        self._advance(4)
 
         # update logfile
         # Dec  5 12:34:54 hostname test: ERROR
@@ -834,8 +756,8 @@ class LogCheckerTestCase(unittest.TestCase):
         self._write_logfile(self.logfile, line3)
 
         # log rotation, purge old logfile2
-        os.rename(self.logfile1, self.logfile2)
-        os.rename(self.logfile, self.logfile1)
+        self._rotate_logfile(self.logfile1, self.logfile2)
+        self._rotate_logfile(self.logfile, self.logfile1)
 
         # seek file of old logfile1 should be purged.
         log.clear_state()
@@ -847,7 +769,7 @@ class LogCheckerTestCase(unittest.TestCase):
         self.assertEqual(log.get_state(), LogChecker.STATE_WARNING)
         self.assertEqual(
             log.get_message(),
-            self.MESSAGE_WARNING_ONE.format(line3, self.logfile1))
+            self._warn1(line3, self.logfile1))
         self.assertEqual(seekfile_1, seekfile1_2)
         self.assertFalse(os.path.exists(seekfile1_1))
         self.assertTrue(os.path.exists(seekfile1_2))
@@ -855,11 +777,11 @@ class LogCheckerTestCase(unittest.TestCase):
     def test_remove_seekfile_inode_with_dry_run(self):
         """--trace_inode, --expiration, --remove-seekfile, and --dry-run options
         """
-        self.config["pattern_list"] = ["ERROR"]
-        self.config["trace_inode"] = True
-        self.config["scantime"] = 2
-        self.config["expiration"] = 3
-        log = LogChecker(self.config)
+        log = self._get_checker(
+            pattern_list=["ERROR"],
+            trace_inode=True,
+            scantime=2,
+            expiration=3)
 
         # create logfile
         # Dec  5 12:34:50 hostname test: ERROR
@@ -867,7 +789,7 @@ class LogCheckerTestCase(unittest.TestCase):
         self._write_logfile(self.logfile, line1)
 
         # log rotation
-        os.rename(self.logfile, self.logfile1)
+        self._rotate_logfile(self.logfile, self.logfile1)
 
         # create new logfile
         # Dec  5 12:34:50 hostname test: ERROR
@@ -881,7 +803,7 @@ class LogCheckerTestCase(unittest.TestCase):
             self.logfile_pattern, self.logfile, trace_inode=True)
         seekfile1_1 = log._create_seek_filename(
             self.logfile_pattern, self.logfile1, trace_inode=True)
-        time.sleep(4)
+        self._advance(4)
 
         # update logfile
         # Dec  5 12:34:54 hostname test: ERROR
@@ -889,12 +811,11 @@ class LogCheckerTestCase(unittest.TestCase):
         self._write_logfile(self.logfile, line3)
 
         # log rotation, purge old logfile2
-        os.rename(self.logfile1, self.logfile2)
-        os.rename(self.logfile, self.logfile1)
+        self._rotate_logfile(self.logfile1, self.logfile2)
+        self._rotate_logfile(self.logfile, self.logfile1)
 
         # with dry run
-        self.config["dry_run"] = True
-        log = LogChecker(self.config)
+        log = self._get_checker(dry_run=True)
 
         log.clear_state()
         log.check(
@@ -905,34 +826,15 @@ class LogCheckerTestCase(unittest.TestCase):
         self.assertEqual(log.get_state(), LogChecker.STATE_WARNING)
         self.assertEqual(
             log.get_message(),
-            self.MESSAGE_WARNING_ONE.format(line3, self.logfile1))
+            self._warn1(line3, self.logfile1))
         self.assertEqual(seekfile_1, seekfile1_2)
         self.assertTrue(os.path.exists(seekfile1_1))
         self.assertTrue(os.path.exists(seekfile1_2))
 
-    def test_replace_pipe_symbol(self):
-        """replace pipe symbol
-        """
-        line = "Dec | 5 12:34:56 hostname test: ERROR"
-        self.config["pattern_list"] = ["ERROR"]
-        log = LogChecker(self.config)
-
-        # Dec  5 12:34:50 hostname test: ERROR |
-        line = self._make_line(self._get_timestamp(), "test", "ERROR |")
-        self._write_logfile(self.logfile, line)
-        log.check(self.logfile)
-
-        self.assertEqual(log.get_state(), LogChecker.STATE_WARNING)
-        self.assertEqual(
-            log.get_message(),
-            self.MESSAGE_WARNING_ONE.format(
-                line.replace("|", "(pipe)"), self.logfile))
-
     def test_seekfile(self):
         """--seekfile option
         """
-        self.config["pattern_list"] = ["ERROR"]
-        log = LogChecker(self.config)
+        log = self._get_checker(pattern_list=["ERROR"])
 
         # 1 line matched
         # Dec  5 12:34:50 hostname test: ERROR
@@ -943,7 +845,7 @@ class LogCheckerTestCase(unittest.TestCase):
         self.assertEqual(log.get_state(), LogChecker.STATE_WARNING)
         self.assertEqual(
             log.get_message(),
-            self.MESSAGE_WARNING_ONE.format(line1, self.logfile))
+            self._warn1(line1, self.logfile))
 
         # 2 lines matched
         # Dec  5 12:34:50 hostname test: ERROR1
@@ -957,7 +859,7 @@ class LogCheckerTestCase(unittest.TestCase):
         self.assertEqual(log.get_state(), LogChecker.STATE_WARNING)
         self.assertEqual(
             log.get_message(),
-            self.MESSAGE_WARNING_TWO.format(line2, line3, self.logfile))
+            self._warn2(line2, line3, self.logfile))
 
         # no line matched
         # Dec  5 12:34:50 hostname noop: NOOP
@@ -972,8 +874,7 @@ class LogCheckerTestCase(unittest.TestCase):
     def test_tag(self):
         """--tag
         """
-        self.config["pattern_list"] = ["ERROR"]
-        log = LogChecker(self.config)
+        log = self._get_checker(pattern_list=["ERROR"])
 
         # create new logfiles
         # Dec  5 12:34:50 hostname test: ERROR
@@ -1003,7 +904,7 @@ class LogCheckerTestCase(unittest.TestCase):
         self.assertEqual(log.get_state(), LogChecker.STATE_WARNING)
         self.assertEqual(
             log.get_message(),
-            self.MESSAGE_WARNING_ONE.format(line2, self.logfile1))
+            self._warn1(line2, self.logfile1))
         self.assertEqual(seekfile_1, seekfile_2)
         self.assertNotEqual(seekfile_1, seekfile_3)
         self.assertTrue(seekfile_1.find(self.tag1))
@@ -1012,9 +913,7 @@ class LogCheckerTestCase(unittest.TestCase):
     def test_cachetime(self):
         """--cachetime
         """
-        self.config["pattern_list"] = ["ERROR"]
-        self.config["cachetime"] = 2
-        log = LogChecker(self.config)
+        log = self._get_checker(pattern_list=["ERROR"], cachetime=2)
 
         cachefile = log._create_cache_filename(self.logfile)
 
@@ -1030,7 +929,7 @@ class LogCheckerTestCase(unittest.TestCase):
         self.assertEqual(log.get_state(), LogChecker.STATE_WARNING)
         self.assertEqual(
             log.get_message(),
-            self.MESSAGE_WARNING_ONE.format(line, self.logfile))
+            self._warn1(line, self.logfile))
 
         # check again
         log.clear_state()
@@ -1039,7 +938,7 @@ class LogCheckerTestCase(unittest.TestCase):
         self.assertEqual(log.get_state(), LogChecker.STATE_WARNING)
         self.assertEqual(
             log.get_message(),
-            self.MESSAGE_WARNING_ONE.format(line, self.logfile))
+            self._warn1(line, self.logfile))
 
         log._remove_cache(cachefile)
 
@@ -1054,10 +953,10 @@ class LogCheckerTestCase(unittest.TestCase):
         self.assertEqual(log.get_state(), LogChecker.STATE_WARNING)
         self.assertEqual(
             log.get_message(),
-            self.MESSAGE_WARNING_ONE.format(line, self.logfile))
+            self._warn1(line, self.logfile))
 
         # check again
-        time.sleep(self.config["cachetime"] + 1)
+        self._advance(self.config["cachetime"] + 1)
         log.clear_state()
         log.check(self.logfile)
 
@@ -1068,9 +967,7 @@ class LogCheckerTestCase(unittest.TestCase):
     def test_cachetime_with_dry_run(self):
         """--cachetime and --dry-run
         """
-        self.config["pattern_list"] = ["ERROR"]
-        self.config["cachetime"] = 60
-        log = LogChecker(self.config)
+        log = self._get_checker(pattern_list=["ERROR"], cachetime=60)
 
         cachefile = log._create_cache_filename(self.logfile)
 
@@ -1085,11 +982,10 @@ class LogCheckerTestCase(unittest.TestCase):
         self.assertEqual(log.get_state(), LogChecker.STATE_WARNING)
         self.assertEqual(
             log.get_message(),
-            self.MESSAGE_WARNING_ONE.format(line, self.logfile))
+            self._warn1(line, self.logfile))
 
         # verify it does not read a cache file.
-        self.config["dry_run"] = True
-        log = LogChecker(self.config)
+        log = self._get_checker(dry_run=True)
 
         # Dec  5 12:34:50 hostname test: NOOP
         line = self._make_line(self._get_timestamp(), "test", "NOOP")
@@ -1101,8 +997,7 @@ class LogCheckerTestCase(unittest.TestCase):
         self.assertEqual(log.get_state(), LogChecker.STATE_OK)
 
         # verify a cache file is not updated.
-        self.config["dry_run"] = False
-        log = LogChecker(self.config)
+        log = self._get_checker(dry_run=False)
 
         # Dec  5 12:34:50 hostname test: ERROR
         line = self._make_line(self._get_timestamp(), "test", "ERROR")
@@ -1114,91 +1009,85 @@ class LogCheckerTestCase(unittest.TestCase):
         self.assertEqual(log.get_state(), LogChecker.STATE_WARNING)
         self.assertEqual(
             log.get_message(),
-            self.MESSAGE_WARNING_ONE.format(line, self.logfile))
+            self._warn1(line, self.logfile))
 
         log._remove_cache(cachefile)
 
     def test_lock_timeout(self):
         """--lock-timeout
         """
-        self.config["pattern_list"] = ["ERROR"]
-        self.config["lock_timeout"] = 6
-        log = LogChecker(self.config)
+        log = self._get_checker(pattern_list=["ERROR"], lock_timeout=3)
 
         lockfile = log._create_lock_filename(self.logfile)
 
         # within lock_timeout
-        #   |time|sub        |main       |
+        #   |time|thread     |main       |
         #   |----|-----------|-----------|
-        #   |   0|fork       |sleep      |
-        #   |   1|lock OK    |sleep      |
-        #   |   1|           |check      |
-        #   |   1|           |lock fail  |
+        #   |   0|lock OK    |           |
+        #   |   0|           |check      |
+        #   |   0|           |lock fail  |
         #   |   *|           |sleep      |
-        #   |   5|unlock OK  |sleep      |
-        #   |   5|           |lock OK    |
-        #   |   5|           |unlock OK  |
+        #   |   1|unlock OK  |sleep      |
+        #   |   1|           |lock OK    |
+        #   |   1|           |unlock OK  |
         # Dec  5 12:34:50 hostname test: ERROR
         line = self._make_line(self._get_timestamp(), "test", "ERROR")
         self._write_logfile(self.logfile, line)
 
-        # locked by an another process
-        locked_time = 4
-        wait_interval = 0.1
-        proc = self._run_locked_subprocess(lockfile, locked_time)
-        for _ in range(100):
-            if os.path.isfile(lockfile):
-                break
-            time.sleep(wait_interval)
+        # locked by an another thread
+        locked_time = 1
+        release_event = threading.Event()
+        thread = self._hold_lock(lockfile, release_event)
+        timer = threading.Timer(locked_time, release_event.set)
+        timer.start()
 
         # check
         log.clear_state()
         start_time = time.time()
-        log.check(self.logfile)
-        elapsed_time = time.time() - start_time
-        proc.wait()
+        try:
+            log.check(self.logfile)
+            elapsed_time = time.time() - start_time
+        finally:
+            timer.join()
+            thread.join()
 
         self.assertEqual(log.get_state(), LogChecker.STATE_WARNING)
         self.assertEqual(
             log.get_message(),
-            self.MESSAGE_WARNING_ONE.format(line, self.logfile))
+            self._warn1(line, self.logfile))
         self.assertTrue(elapsed_time < self.config["lock_timeout"])
-        self.assertTrue(elapsed_time > locked_time - wait_interval)
+        self.assertTrue(elapsed_time >= locked_time)
 
         # over lock_timeout
-        #   |time|sub        |main       |
+        #   |time|thread     |main       |
         #   |----|-----------|-----------|
-        #   |   0|fork       |sleep      |
-        #   |   1|lock OK    |sleep      |
-        #   |   1|           |check      |
-        #   |   1|           |lock fail  |
+        #   |   0|lock OK    |           |
+        #   |   0|           |check      |
+        #   |   0|           |lock fail  |
         #   |   *|           |sleep      |
-        #   |   7|           |timeout    |
-        #   |   9|unlock OK  |           |
+        #   |   3|           |timeout    |
+        #   |   3|unlock OK  |           |
         # Dec  5 12:34:50 hostname test: ERROR
         line = self._make_line(self._get_timestamp(), "test", "ERROR")
         self._write_logfile(self.logfile, line)
 
-        # locked by an another process
-        locked_time = 8
-        wait_interval = 0.1
-        proc = self._run_locked_subprocess(lockfile, locked_time)
-        for _ in range(100):
-            if os.path.isfile(lockfile):
-                break
-            time.sleep(wait_interval)
+        # locked by an another thread until the check finishes
+        release_event = threading.Event()
+        thread = self._hold_lock(lockfile, release_event)
 
         # check
         log.clear_state()
         start_time = time.time()
-        log.check(self.logfile)
-        elapsed_time = time.time() - start_time
-        proc.wait()
+        try:
+            log.check(self.logfile)
+            elapsed_time = time.time() - start_time
+        finally:
+            release_event.set()
+            thread.join()
 
         self.assertEqual(log.get_state(), LogChecker.STATE_UNKNOWN)
         self.assertEqual(log.get_message(), self.MESSAGE_UNKNOWN_LOCK_TIMEOUT)
         self.assertTrue(elapsed_time > self.config["lock_timeout"])
-        self.assertTrue(elapsed_time < locked_time)
 
     def test_lock(self):
         """LogChecker.lock()
@@ -1208,19 +1097,18 @@ class LogCheckerTestCase(unittest.TestCase):
         self.assertNotEqual(lockfileobj, None)
         LogChecker.unlock(self.lockfile, lockfileobj)
 
-        # locked by an another process
-        locked_time = 4
-        wait_interval = 0.1
-        proc = self._run_locked_subprocess(self.lockfile, locked_time)
-        for _ in range(100):
-            if os.path.isfile(self.lockfile):
-                break
-            time.sleep(wait_interval)
-
-        with warnings.catch_warnings():
-            warnings.simplefilter("ignore")
-            lockfileobj = LogChecker.lock(self.lockfile)
-        proc.wait()
+        # locked by an another file descriptor
+        # flock() locks belong to the open file description, so a lock taken
+        # on another descriptor conflicts even within this process.
+        fd = os.open(self.lockfile, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore")
+                lockfileobj = LogChecker.lock(self.lockfile)
+            fcntl.flock(fd, fcntl.LOCK_UN)
+        finally:
+            os.close(fd)
         self.assertEqual(lockfileobj, None)
 
     def test_unlock(self):
@@ -1231,78 +1119,160 @@ class LogCheckerTestCase(unittest.TestCase):
         self.assertFalse(os.path.exists(self.lockfile))
         self.assertTrue(lockfileobj.closed)
 
+    def test_compile_pattern_list(self):
+        """LogChecker._compile_pattern_list()
+        """
+        # a literal string is not compiled.
+        matchers = LogChecker._compile_pattern_list(["ERROR", "ERROR.*", ""])
+        self.assertEqual(len(matchers), 2)
+        self.assertEqual(matchers[0], ("ERROR", None, ("ERROR",)))
+        self.assertEqual(matchers[1][0], "ERROR.*")
+        self.assertNotEqual(matchers[1][1], None)
+        self.assertEqual(matchers[1][2], ("ERROR.*",))
+
+        # a literal string is compiled with flags.
+        matchers = LogChecker._compile_pattern_list(["ERROR"], re.IGNORECASE)
+        self.assertEqual(len(matchers), 1)
+        self.assertNotEqual(matchers[0][1], None)
+
+        # regular expressions are combined by the leading character.
+        patterns = ["E.*1", "F.*", "E.*2", "(E)RROR", "(?i)E.*3"]
+        matchers = LogChecker._compile_pattern_list(patterns)
+        self.assertEqual(
+            [x[0] for x in matchers],
+            ["(E)RROR", "(?i)E.*3", "(?:E.*1)|(?:E.*2)", "F.*"])
+        self.assertEqual(matchers[2][2], ("E.*1", "E.*2"))
+        self.assertTrue(matchers[2][1].search("ERROR2"))
+        self.assertFalse(matchers[2][1].search("error2"))
+
+    def _sub_test(self, **params):
+        """Return subTest() or a dummy context manager on Python 2."""
+        if hasattr(self, 'subTest'):
+            return self.subTest(**params)
+        return _null_context()
+
+    def _get_checker(self, **overrides):
+        """Return a LogChecker for the configuration updated by overrides.
+
+        The instance is reused while the configuration is the same in a test.
+        """
+        self.config.update(overrides)
+        key = tuple(sorted(
+            (k, tuple(v) if isinstance(v, list) else v)
+            for k, v in self.config.items()))
+        log = self._checkers.get(key)
+        if log is None:
+            log = LogChecker(self.config)
+            self._checkers[key] = log
+        log.clear_state()
+        return log
+
+    def _advance(self, seconds):
+        """Age log files and state files instead of sleeping."""
+        for dirpath, _, filenames in os.walk(self._td):
+            for filename in filenames:
+                path = os.path.join(dirpath, filename)
+                stat = os.stat(path)
+                os.utime(
+                    path, (stat.st_atime - seconds, stat.st_mtime - seconds))
+
+    def _rotate_logfile(self, logfile, rotated_logfile):
+        """Rotate the log file, keeping its inode.
+
+        An existing rotated log file is replaced.
+        """
+        fd = self._logfds.pop(rotated_logfile, None)
+        if fd is not None:
+            os.close(fd)
+        if os.path.lexists(rotated_logfile):
+            os.unlink(rotated_logfile)
+        os.link(logfile, rotated_logfile)
+        os.unlink(logfile)
+        # The descriptor now appends to the rotated file.
+        if logfile in self._logfds:
+            self._logfds[rotated_logfile] = self._logfds.pop(logfile)
+
     def _get_timestamp(self):
         # format: Dec  5 12:34:00
-        timestamp = LogChecker.to_unicode(
-            datetime.datetime.now().strftime("%b %e %T"))
-        return timestamp
+        return self._strftime_now("%b %e %T")
 
     def _get_customized_timestamp(self):
         # format: Thu Dec 05 12:34:56 2013
-        timestamp = LogChecker.to_unicode(
-            datetime.datetime.now().strftime("%a %b %d %T %Y"))
-        return timestamp
+        return self._strftime_now("%a %b %d %T %Y")
+
+    def _strftime_now(self, fmt):
+        """Format the current time, reusing the string within a second."""
+        now = int(time.time())
+        cache = self._TIMESTAMP_CACHE.get(fmt)
+        if cache is None or cache[0] != now:
+            timestamp = LogChecker.to_unicode(
+                time.strftime(fmt, time.localtime(now)))
+            cache = (now, timestamp)
+            self._TIMESTAMP_CACHE[fmt] = cache
+        return cache[1]
 
     def _make_line(self, timestamp, tag, message):
         # format: Dec  5 12:34:00 hostname noop: NOOP
-        line = "{0} hostname {1}: {2}".format(timestamp, tag, message)
-        return line
+        return timestamp + " hostname " + tag + ": " + message
 
     def _make_customized_line(self, timestamp, level, message):
         # format: [Thu Dec 05 12:34:56 2013] [info] NOOP
-        line = "[{0}] [{1}] {2}".format(timestamp, level, message)
-        return line
+        return "[" + timestamp + "] [" + level + "] " + message
 
     def _write_logfile(self, logfile, lines, encoding='utf-8'):
         """Write log file for syslog format."""
-        fileobj = io.open(logfile, mode='a', encoding=encoding)
-        fileobj.write(self._make_line(self._get_timestamp(), "noop", "NOOP"))
-        fileobj.write("\n")
-        if isinstance(lines, list):
-            for line in lines:
-                fileobj.write(line)
-                fileobj.write("\n")
-        else:
-            fileobj.write(lines)
-            fileobj.write("\n")
-        fileobj.write(self._make_line(self._get_timestamp(), "noop", "NOOP"))
-        fileobj.write("\n")
-        fileobj.flush()
-        fileobj.close()
+        if not isinstance(lines, list):
+            lines = [lines]
+        noop = self.NOOP_LINE
+        self._append_lines(logfile, [noop] + lines + [noop], encoding)
 
     def _write_customized_logfile(self, logfile, lines, encoding='utf-8'):
         """Write log file for customized format."""
-        fileobj = io.open(logfile, mode='a', encoding=encoding)
-        fileobj.write(
-            self._make_customized_line(
-                self._get_customized_timestamp(), "info", "NOOP"))
-        fileobj.write("\n")
-        if isinstance(lines, list):
-            for line in lines:
-                fileobj.write(line)
-                fileobj.write("\n")
-        else:
-            fileobj.write(lines)
-            fileobj.write("\n")
-        fileobj.write(
-            self._make_customized_line(
-                self._get_customized_timestamp(), "info", "NOOP"))
-        fileobj.write("\n")
-        fileobj.flush()
-        fileobj.close()
-
-    def _run_locked_subprocess(self, lockfile, sleeptime):
-        code = (
-            "import time\n"
-            "from check_log_ng import LogChecker\n"
-            "lockfile = '{0}'\n"
-            "lockfileobj = LogChecker.lock(lockfile)\n"
-            "time.sleep({1})\n"
-            "LogChecker.unlock(lockfile, lockfileobj)\n"
-        ).format(lockfile, LogChecker.to_unicode(str(sleeptime)))
-        code = code.replace("\n", ";")
-        proc = subprocess.Popen(['python', '-c', code])
-        return proc
+        if not isinstance(lines, list):
+            lines = [lines]
+        noop = self.CUSTOMIZED_NOOP_LINE
+        self._append_lines(logfile, [noop] + lines + [noop], encoding)
+
+    def _append_lines(self, logfile, lines, encoding):
+        """Append lines to the file with one system call.
+
+        The file is kept open until the end of the test.
+        """
+        data = ("\n".join(lines) + "\n").encode(encoding, 'strict')
+        fd = self._logfds.get(logfile)
+        if fd is None:
+            fd = os.open(
+                logfile, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+            self._logfds[logfile] = fd
+        os.write(fd, data)
+
+    def _hold_lock(self, lockfile, release_event):
+        """Hold the lock in another thread until release_event is set.
+
+        Return after the thread acquires the lock.
+        """
+        locked_event = threading.Event()
+        holder = {}
+
+        def hold():
+            try:
+                holder['lockfileobj'] = LogChecker.lock(lockfile)
+            finally:
+                locked_event.set()
+            if holder['lockfileobj'] is None:
+                return
+            release_event.wait()
+            LogChecker.unlock(lockfile, holder['lockfileobj'])
+
+        # A daemon thread does not block the interpreter exit
+        # if a test fails before release_event is set.
+        thread = threading.Thread(target=hold)
+        thread.daemon = True
+        thread.start()
+        locked_event.wait()
+        self.assertIsNotNone(
+            holder.get('lockfileobj'), "failed to lock in the thread")
+        return thread
 
 
 if __name__ == "__main__":